@@ -1,14 +1,24 @@
+import os
+import sys
 import time 
 import logging
-import xml.etree.ElementTree as ET
+import functools
+
+try:
+    # libxml2 based parser, considerably faster than the pure python wrappers
+    from lxml import etree as ET
+    _ITERPARSE_OPTIONS = {"remove_comments": True, "remove_pis": True, "huge_tree": False}
+except ImportError:
+    import xml.etree.ElementTree as ET
+    _ITERPARSE_OPTIONS = {}
 
 def timer(func):
     def wrapper(*args, **kwargs):
-        start = time.time()
+        start = time.perf_counter_ns()
         res = func(*args, **kwargs)
-        end = time.time()
-        duration = end - start
-        logging.info(f"{func.__name__}(): execution duration: {duration:.4f}s")
+        if logging.getLogger().isEnabledFor(logging.INFO):
+            duration = (time.perf_counter_ns() - start) / 1e9
+            logging.info("%s(): execution duration: %.4fs", func.__name__, duration)
         return res 
     return wrapper
 
@@ -21,36 +31,52 @@ def parse_config(config_path):
 
     Raises:
         FileNotFoundError: If the configuration file does not exist.
-        ET.ParseError: If there is an error parsing the XML file.
+        ET.ParseError: If there is an error parsing the XML file
+            (lxml.etree.XMLSyntaxError when lxml is installed).
 
     Returns:
         Dict[str, Any]: A dictionary representing the parsed configuration.
+            The dictionary is shared between calls and must not be modified.
     """
-    def _parse_element(element):
-        if len(element) == 0:
-            return element.text
-        
-        child_dict = {}
-        for child in element:
-            if child.tag in child_dict:
-                # If a tag is encountered again, store values in a list
-                if not isinstance(child_dict[child.tag], list):
-                    child_dict[child.tag] = [child_dict[child.tag]]
-                child_dict[child.tag].append(_parse_element(child))
-            else:
-                child_dict[child.tag] = _parse_element(child)
-        return child_dict
-    
+    # keyed on modification time so an edited file is parsed again
+    mtime_ns = os.stat(config_path).st_mtime_ns
+    return _parse_config_cached(config_path, mtime_ns)
+
+@functools.lru_cache(maxsize=16)
+def _parse_config_cached(config_path, mtime_ns):
     dict_config = {}
-    root = ET.parse(config_path).getroot()
+    # stack of (element, dict of parsed children) for the currently open tags
+    stack = []
+
+    for event, element in ET.iterparse(config_path, events=("start", "end"), **_ITERPARSE_OPTIONS):
+        if event == "start":
+            stack.append((element, {}))
+            continue
+
+        _, child_dict = stack.pop()
+        if not stack:
+            # root element is always returned as a dictionary
+            dict_config = child_dict
+            continue
 
-    for child in root:
-        if child.tag in dict_config:
-            if not isinstance(dict_config[child.tag], list):
-                dict_config[child.tag] = [dict_config[child.tag]]
-            dict_config[child.tag].append(_parse_element(child))
+        parent, parent_dict = stack[-1]
+        # tags and values repeat across datasources, share a single string for each
+        tag = sys.intern(element.tag)
+        if child_dict:
+            value = child_dict
         else:
-            dict_config[child.tag] = _parse_element(child)
+            value = sys.intern(element.text) if element.text is not None else None
 
-    return dict_config
+        if tag in parent_dict:
+            # If a tag is encountered again, store values in a list
+            if not isinstance(parent_dict[tag], list):
+                parent_dict[tag] = [parent_dict[tag]]
+            parent_dict[tag].append(value)
+        else:
+            parent_dict[tag] = value
 
+        # release the processed subtree, only open tags are kept in memory
+        element.clear()
+        parent.remove(element)
+
+    return dict_config
@@ -1,10 +1,29 @@
+from dataclasses import dataclass, field, fields, replace
 from datetime import datetime, timedelta
-from typing import Optional, Union, Literal
-from pydantic import BaseModel 
-from pydantic import model_validator, Field
+from functools import lru_cache
+from typing import Optional, Union, Literal, Dict, Any, Annotated
+from pydantic import BaseModel
+from pydantic import model_validator, Field, ConfigDict
+
+
+# Schemas are built on first validation, unknown keys in the config are rejected
+_MODEL_CONFIG = ConfigDict(
+    defer_build=True,
+    validate_assignment=False,
+    extra='forbid',
+    frozen=False
+)
+
+
+@lru_cache(maxsize=128)
+def _strftime(process_datetime: datetime, template: str) -> str:
+    # templates repeat across datasources and reruns of a config for the same datetime
+    return process_datetime.strftime(template)
 
 
 class Args(BaseModel):
+    model_config = _MODEL_CONFIG
+
     config: str
     datetime: Optional[str]
     verbose: bool
@@ -12,6 +31,8 @@ class Args(BaseModel):
 
 
 class Setting(BaseModel):
+    model_config = _MODEL_CONFIG
+
     validation_name: str
     validation_threshold: int = Field(le=100)
     validate_content: bool = False
@@ -32,10 +53,34 @@ class Setting(BaseModel):
     ] = None
 
 
-class CsvOptions(BaseModel):
+class SparkOptions:
+    """
+    Base for the spark reader options, options left unset are not passed to spark.
+    The options are frozen, so the dictionary is built once per instance.
+    """
+    __slots__ = ("_spark_options",)
+    # spark options outside of the listed ones are ignored rather than rejected
+    __pydantic_config__ = ConfigDict(extra='ignore')
+
+    def to_spark_options(self) -> Dict[str, Any]:
+        try:
+            _spark_options = self._spark_options
+        except AttributeError:
+            _spark_options = {
+                f.name: getattr(self, f.name)
+                for f in fields(self)
+                if f.metadata.get("spark_option", True) and getattr(self, f.name) is not None
+            }
+            object.__setattr__(self, "_spark_options", _spark_options)
+        return _spark_options.copy()
+
+
+@dataclass(slots=True, frozen=True)
+class CsvOptions(SparkOptions):
     """
     https://spark.apache.org/docs/3.5.4/sql-data-sources-csv.html
     """
+    format: Literal["csv"] = field(default="csv", metadata={"spark_option": False})
     sep: Optional[str] = None
     encoding: Optional[str] = None
     quote: Optional[str] = None
@@ -82,10 +127,12 @@ class CsvOptions(BaseModel):
     ] = None
 
 
-class ParquetOptions(BaseModel):
+@dataclass(slots=True, frozen=True)
+class ParquetOptions(SparkOptions):
     """
     https://spark.apache.org/docs/3.5.4/sql-data-sources-parquet.html
     """
+    format: Literal["parquet"] = field(default="parquet", metadata={"spark_option": False})
     datetimeRebaseMode: Optional[
         Literal[
             'EXCEPTION',
@@ -105,23 +152,21 @@ class ParquetOptions(BaseModel):
 
 
 class FileConfig(BaseModel):
+    model_config = _MODEL_CONFIG
+
     format: Literal["csv", "parquet"]
     path: str
-    options: Optional[Union[CsvOptions, ParquetOptions]] = None
+    options: Annotated[Union[CsvOptions, ParquetOptions], Field(discriminator="format")]
 
     @model_validator(mode='before')
     def set_file_options(cls, values):
-        _format = values.get('format')
-        _options = values.get('options')
-        
-        if _format == "csv":
-            values['options'] = CsvOptions(**_options) if _options else CsvOptions()
-        elif _format == "parquet":
-            values['options'] = ParquetOptions(**_options) if _options else ParquetOptions()
-        return values
+        # Tag the options with the file format, pydantic picks the options model from it.
+        # A new mapping is returned, the input may be the shared parse_config result
+        return {**values, 'options': {**(values.get('options') or {}), 'format': values.get('format')}}
 
 
-class DatabaseOptions(BaseModel):
+@dataclass(slots=True, frozen=True)
+class DatabaseOptions(SparkOptions):
     """
     https://spark.apache.org/docs/3.5.4/sql-data-sources-jdbc.html
     """
@@ -143,7 +188,6 @@ class DatabaseOptions(BaseModel):
     pushDownPredicate: Optional[bool] = None
     pushDownAggregate: Optional[bool] = None
     pushDownLimit: Optional[bool] = None
-    pushDownLimit: Optional[bool] = None
     pushDownTableSample: Optional[bool] = None
     keytab: Optional[str] = None
     principal: Optional[str] = None
@@ -151,23 +195,23 @@ class DatabaseOptions(BaseModel):
     connectionProvider: Optional[str] = None
     preferTimestampNTZ: Optional[bool] = None
 
-    @model_validator(mode='before')
-    def check_dbtable_or_query(cls, values):
-        dbtable = values.get('dbtable')
-        query = values.get('query')
-        if not (dbtable or query):
+    def __post_init__(self):
+        if not (self.dbtable or self.query):
             raise ValueError("Either 'dbtable' or 'query' must be provided.")
-        if dbtable and query:
+        if self.dbtable and self.query:
             raise ValueError("Only one of 'dbtable' or 'query' should be provided.")
-        return values
 
 
 class DatabaseConfig(BaseModel):
+    model_config = _MODEL_CONFIG
+
     format: Literal["jdbc"]
     options: DatabaseOptions
 
 
 class Datasource(BaseModel):
+    model_config = _MODEL_CONFIG
+
     type: Literal["database", "file"]
     database_config: Optional[DatabaseConfig] = None
     file_config: Optional[FileConfig] = None
@@ -186,6 +230,8 @@ class Datasource(BaseModel):
 
 
 class ValidationConfig(BaseModel):
+    model_config = _MODEL_CONFIG
+
     args: Args
     setting: Setting
     source: Datasource
@@ -228,19 +274,20 @@ class ValidationConfig(BaseModel):
             )
 
         values.process_datetime = _process_datetime
-        return values
-    
-    @model_validator(mode="after")
-    def set_strftime_string(cls, values):
-        _process_datetime: datetime = values.process_datetime
+
+        # Apply process datetime to the strftime templated fields
         try:
-            values.setting.summary_log = _process_datetime.strftime(values.setting.summary_log)
+            values.setting.summary_log = _strftime(_process_datetime, values.setting.summary_log)
             for config in [values.source.database_config, values.target.database_config]:
                 if config and config.options.query:
-                    config.options.query = _process_datetime.strftime(config.options.query)
+                    config.options = replace(
+                        config.options,
+                        query=_strftime(_process_datetime, config.options.query)
+                    )
             for config in [values.source.file_config, values.target.file_config]:
                 if config and config.path:
-                    config.path = _process_datetime.strftime(config.path)
-            return values
+                    config.path = _strftime(_process_datetime, config.path)
         except Exception as e:
             raise ValueError(f"error setting strftime. Error {e}")
+
+        return values
@@ -1,12 +1,25 @@
+import re
 import logging
 import argparse
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from typing import Dict, Any
+from pydantic import TypeAdapter
+from pyspark import StorageLevel
 from pyspark.sql import SparkSession, DataFrame, Row
+from pyspark.sql import functions as F
 
 from helpers.generic import timer, parse_config
 from helpers.models import validation_config
 
+# shared by every config validation, the models use defer_build so the
+# validator is built on first use rather than at import
+_VC_ADAPTER = TypeAdapter(validation_config.ValidationConfig)
+
+# size of a (row_hash, count) row: null bitmap and two longs
+_FINGERPRINT_ROW_BYTES = 24
+
 def setup_logger(log_level = logging.INFO) -> None:
     logging.basicConfig(
         level=log_level,
@@ -19,12 +32,13 @@ def spark_get_session(app_name: str, master: str) -> SparkSession:
         .builder \
         .appName(app_name) \
         .master(_master) \
+        .config("spark.scheduler.mode", "FAIR") \
         .getOrCreate()
     return spark
 
 def spark_read_file(spark: SparkSession, file_config: validation_config.FileConfig) -> DataFrame:
     _format = file_config.format
-    _options = file_config.options.model_dump(exclude_none=True)
+    _options = file_config.options.to_spark_options()
     _path = file_config.path
 
     df = spark.read \
@@ -36,7 +50,7 @@ def spark_read_file(spark: SparkSession, file_config: validation_config.FileConf
 
 def spark_read_db(spark: SparkSession, database_config: validation_config.DatabaseConfig) -> DataFrame:
     _format = database_config.format
-    _options = database_config.options.model_dump(exclude_none=True)
+    _options = database_config.options.to_spark_options()
 
     df = spark.read \
         .format(_format) \
@@ -45,6 +59,25 @@ def spark_read_db(spark: SparkSession, database_config: validation_config.Databa
 
     return df
 
+def spark_count_db(spark: SparkSession, database_config: validation_config.DatabaseConfig) -> int:
+    _format = database_config.format
+    _options = database_config.options.to_spark_options()
+
+    # Let the database count the rows instead of fetching them all into spark,
+    # partitioning and custom schema options do not apply to the count query
+    _table = _options.pop("dbtable", None) or f"({_options.pop('query')}) src"
+    for key in ("partitionColumn", "lowerBound", "upperBound", "numPartitions", "customSchema"):
+        _options.pop(key, None)
+    _options["query"] = f"SELECT COUNT(*) AS row_count FROM {_table}"
+
+    row = spark.read \
+        .format(_format) \
+        .options(**_options) \
+        .load() \
+        .first()
+
+    return int(row[0])
+
 def spark_write_hdfs(spark: SparkSession, config: validation_config.Setting, process_datetime: datetime, data: Dict[str, Any]) -> None:
     # Create a Row object with the required schema
     row = Row(
@@ -58,14 +91,25 @@ def spark_write_hdfs(spark: SparkSession, config: validation_config.Setting, pro
         destination_count=data.get("count_target")
     )
 
-    df = spark.createDataFrame([row])
+    # single row, write it as one part file without the _SUCCESS marker
+    df = spark.createDataFrame([row]).coalesce(1)
     df.write \
+        .option("mapreduce.fileoutputcommitter.marksuccessfuljobs", "false") \
         .format("csv") \
         .mode("append") \
         .save(config.summary_log)
     
     logging.info(f"results written into hdfs: {config.summary_log}")
 
+def spark_broadcast_threshold(spark: SparkSession) -> int:
+    # spark.sql.autoBroadcastJoinThreshold in bytes, -1 when broadcasting is disabled
+    _threshold = spark.conf.get("spark.sql.autoBroadcastJoinThreshold", "10485760b")
+    match = re.fullmatch(r"\s*(-?\d+)\s*([kmgtp]?)b?\s*", _threshold.lower())
+    if not match:
+        return -1
+    value, unit = match.groups()
+    return int(value) * 1024 ** " kmgtp".index(unit or " ")
+
 def read_dataset(spark: SparkSession, dataset_config: validation_config.Datasource) -> DataFrame:
     if dataset_config.type == "file":
         df = spark_read_file(spark, dataset_config.file_config)
@@ -73,21 +117,56 @@ def read_dataset(spark: SparkSession, dataset_config: validation_config.Datasour
         df = spark_read_db(spark, dataset_config.database_config)
     return df
 
-def validate_row_count(df_source: DataFrame, df_target: DataFrame, threshold: int) -> Dict[str, Any]:
-    count_source = df_source.count()
-    count_target = df_target.count()
-    is_passed = False
+def spark_run_in_pool(spark: SparkSession, pool: str, func, *args):
+    # jobs submitted from this thread go to their own fair scheduler pool,
+    # separate pools share the executors instead of queueing FIFO in the default pool
+    spark.sparkContext.setLocalProperty("spark.scheduler.pool", pool)
+    try:
+        return func(*args)
+    finally:
+        spark.sparkContext.setLocalProperty("spark.scheduler.pool", None)
+
+def count_dataset(spark: SparkSession, df: DataFrame, dataset_config: validation_config.Datasource) -> int:
+    # cached dataframes are counted by spark to fill the cache used by content validation,
+    # validate_content relies on cached dataframes being counted with df.count()
+    if dataset_config.type == "database" and not df.is_cached:
+        return spark_count_db(spark, dataset_config.database_config)
+    return df.count()
+
+def validate_row_count(
+    spark: SparkSession,
+    df_source: DataFrame,
+    df_target: DataFrame,
+    source_config: validation_config.Datasource,
+    target_config: validation_config.Datasource,
+    threshold: int
+) -> Dict[str, Any]:
+    # Submit both count jobs together so spark can schedule them in parallel
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        future_source = executor.submit(
+            spark_run_in_pool, spark, "source", count_dataset, spark, df_source, source_config
+        )
+        future_target = executor.submit(
+            spark_run_in_pool, spark, "target", count_dataset, spark, df_target, target_config
+        )
+        count_source = future_source.result()
+        count_target = future_target.result()
 
     count_diff = abs(count_source - count_target)
-    percentage_diff = count_diff / count_source * 100
-    is_passed = True if percentage_diff <= threshold else False 
+    if count_source == 0:
+        # no percentage against an empty source, only an empty target passes
+        percentage_diff = None
+        is_passed = count_target == 0
+    else:
+        percentage_diff = count_diff / count_source * 100
+        is_passed = count_diff * 100 <= threshold * count_source
 
     logging.info(
         f"row count validation results: \n"
         f"source count:         {count_source} \n"
         f"target count:         {count_target} \n"
         f"count diff:           {count_diff} \n"
-        f"percentage diff:      {percentage_diff:.4f} \n"
+        f"percentage diff:      {'N/A' if percentage_diff is None else f'{percentage_diff:.4f}'} \n"
         f"threshold:            {threshold} \n"
         f"validation passed:    {is_passed} \n"
     )
@@ -101,9 +180,16 @@ def validate_row_count(df_source: DataFrame, df_target: DataFrame, threshold: in
         "is_passed": is_passed,
     }
 
-def validate_content(df_source: DataFrame, df_target: DataFrame) -> None:
-    # Ensure schemas match
-    if df_source.columns != df_target.columns:
+def validate_content(df_source: DataFrame, df_target: DataFrame, count_source: int, count_target: int) -> None:
+    # The diffs are derived from count_source and count_target, these must be df.count()
+    # of the given dataframes. count_dataset only guarantees that for cached dataframes.
+    if not (df_source.is_cached and df_target.is_cached):
+        raise ValueError("content validation expects persisted dataframes counted with df.count()")
+
+    # Ensure schemas match, column order does not matter but repeated names do
+    source_columns = df_source.columns
+    target_columns = df_target.columns
+    if Counter(source_columns) != Counter(target_columns):
         logging.info(
             f"content validation results: \n"
             f"schema match:         false \n"
@@ -115,16 +201,49 @@ def validate_content(df_source: DataFrame, df_target: DataFrame) -> None:
         logging.info(df_target.schema)
         return
 
-    # Create a unique identifier by concatenating all columns
-    source_hash = df_source.selectExpr("concat_ws('||', *) as row").distinct()
-    target_hash = df_target.selectExpr("concat_ws('||', *) as row").distinct()
+    if count_source == 0 or count_target == 0:
+        # Nothing to match against, every row of the other side is a difference
+        diff_source_count = count_source
+        diff_target_count = count_target
+    else:
+        # Column names may contain dots or repeat, so columns are renamed by position.
+        # Target columns are lined up with the source by name, repeated names in order
+        target_positions = {}
+        for i, c in enumerate(target_columns):
+            target_positions.setdefault(c, []).append(i)
+        target_order = [target_positions[c].pop(0) for c in source_columns]
+        positional_columns = [f"_c{i}" for i in range(len(source_columns))]
+
+        # Fingerprint each row, columns are compared on their string representation
+        # and hashed in source column order on both sides
+        source_hash = df_source.toDF(*positional_columns).select(
+            F.xxhash64(*[F.col(c).cast("string") for c in positional_columns]).alias("row_hash")
+        )
+        target_hash = df_target.toDF(*positional_columns).select(
+            F.xxhash64(*[F.col(positional_columns[i]).cast("string") for i in target_order]).alias("row_hash")
+        )
+
+        # Count occurrences of each fingerprint on both sides
+        source_counts = source_hash.groupBy("row_hash").agg(F.count("*").alias("source_count"))
+        target_counts = target_hash.groupBy("row_hash").agg(F.count("*").alias("target_count"))
+
+        # Broadcast the smaller side when its fingerprint counts fit the broadcast threshold
+        threshold = spark_broadcast_threshold(df_source.sparkSession)
+        if threshold >= 0 and min(count_source, count_target) * _FINGERPRINT_ROW_BYTES < threshold:
+            if count_source <= count_target:
+                source_counts = F.broadcast(source_counts)
+            else:
+                target_counts = F.broadcast(target_counts)
 
-    # Find differences
-    diff_source = source_hash.subtract(target_hash)
-    diff_target = target_hash.subtract(source_hash)
+        # Find differences, rows present on both sides are matched up to the lower count,
+        # the remaining rows of each side are the differences
+        matched_count = source_counts \
+            .join(target_counts, "row_hash", "inner") \
+            .agg(F.sum(F.least(F.col("source_count"), F.col("target_count")))) \
+            .first()[0] or 0
+        diff_source_count = count_source - matched_count
+        diff_target_count = count_target - matched_count
 
-    diff_source_count = diff_source.count()
-    diff_target_count = diff_target.count()
     is_passed = (diff_source_count == 0) and (diff_target_count == 0)
     
     logging.info(
@@ -154,10 +273,7 @@ def main():
     # args and config
     args = parse_args()
     dict_config = parse_config(args.config)
-    config = validation_config.ValidationConfig(
-        **dict_config,
-        args=vars(args)
-    )
+    config = _VC_ADAPTER.validate_python({**dict_config, "args": vars(args)})
 
     # setup logger
     setup_logger()
@@ -178,20 +294,37 @@ def main():
     logging.info(f"Spark session initialized, using master: {config.args.spark_master}")
 
     # validation
-    # read dfs
-    df_source = read_dataset(spark, config.source)
-    df_target = read_dataset(spark, config.target)
+    # read dfs, schema inference and jdbc metadata queries of both sides overlap
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        future_source = executor.submit(read_dataset, spark, config.source)
+        future_target = executor.submit(read_dataset, spark, config.target)
+        df_source = future_source.result()
+        df_target = future_target.result()
     logging.info("datasources fetched")
 
+    # datasources are scanned again by content validation, read them only once
+    if config.setting.validate_content:
+        df_source = df_source.persist(StorageLevel.MEMORY_AND_DISK)
+        df_target = df_target.persist(StorageLevel.MEMORY_AND_DISK)
+
     # validate row count
-    res = validate_row_count(df_source, df_target, config.setting.validation_threshold)
+    res = validate_row_count(
+        spark,
+        df_source,
+        df_target,
+        config.source,
+        config.target,
+        config.setting.validation_threshold
+    )
 
     # write to report file
     spark_write_hdfs(spark, config.setting, config.process_datetime, res)
 
     # Validate content
     if config.setting.validate_content:
-        validate_content(df_source, df_target)
+        validate_content(df_source, df_target, res["count_source"], res["count_target"])
+        df_source.unpersist()
+        df_target.unpersist()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file